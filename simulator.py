@@ -1,9 +1,17 @@
 import streamlit as st
-import graphviz
-from typing import Dict, List, Optional
-from dataclasses import dataclass
+from bisect import insort
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Tuple
+from dataclasses import dataclass, field
 
-@dataclass
+SYMBOLS = {
+    'R': 'R',
+    'L': 'L',
+    'C': 'C',
+    'G': '⏚'
+}
+
+@dataclass(slots=True)
 class Component:
     type: str
     value: float
@@ -17,15 +25,9 @@ class Component:
         return f"{self.type}: {self.value} {self.unit}"
     
     def get_symbol(self) -> str:
-        symbols = {
-            'R': 'R',
-            'L': 'L',
-            'C': 'C',
-            'G': '⏚'
-        }
-        return symbols.get(self.type, '─○─')
-
-@dataclass
+        return SYMBOLS.get(self.type, '─○─')
+
+@dataclass(slots=True)
 class FilterBlock:
     name: str
     position: int
@@ -35,157 +37,207 @@ class FilterBlock:
     sub_blocks: List['FilterBlock'] = None
     start_node: int = 0
     end_node: int = 0
+    topology: Optional['FilterTopology'] = field(default=None, init=False, repr=False, compare=False)
 
     def __post_init__(self):
         if self.components is None:
-            self.components = {component_type: [] for component_type in COMPONENTS.keys()}
+            self.components = {spec.type: [] for spec in COMPONENTS}
         if self.sub_blocks is None:
             self.sub_blocks = []
         if self.block_id is None:
             self.block_id = f"block_{id(self)}"
 
+    def _changed(self):
+        if self.topology is not None:
+            self.topology.invalidate()
+
     def add_component(self, component_type: str, value: float, unit: str):
         if component_type in self.components:
             self.components[component_type].append(Component(component_type, value, unit))
+            self._changed()
 
     def remove_component(self, component_type: str, index: int):
         if component_type in self.components and 0 <= index < len(self.components[component_type]):
             self.components[component_type].pop(index)
+            self._changed()
 
     def add_sub_block(self, block: 'FilterBlock'):
         block.parent_id = self.block_id
-        self.sub_blocks.append(block)
-        self.sub_blocks.sort(key=lambda x: x.position)
+        for sub_block, _ in walk_blocks([block]):
+            sub_block.topology = self.topology
+        insort(self.sub_blocks, block, key=lambda x: x.position)
+        self._changed()
 
     def remove_sub_block(self, block_id: str):
         self.sub_blocks = [b for b in self.sub_blocks if b.block_id != block_id]
         for idx, block in enumerate(self.sub_blocks):
             block.position = idx
+        self._changed()
 
-COMPONENTS = {
-    'C': {'name': 'Capacitor', 'units': ['pF', 'nF', 'µF', 'mF']},
-    'L': {'name': 'Inductor', 'units': ['nH', 'µH', 'mH', 'H']},
-    'R': {'name': 'Resistor', 'units': ['Ω', 'kΩ', 'MΩ']},
-    'G': {'name': 'Ground', 'units': ['-']}
-}
+@dataclass(frozen=True, slots=True)
+class ComponentSpec:
+    type: str
+    name: str
+    units: Tuple[str, ...]
+
+COMPONENTS: Tuple[ComponentSpec, ...] = (
+    ComponentSpec('C', 'Capacitor', ('pF', 'nF', 'µF', 'mF')),
+    ComponentSpec('L', 'Inductor', ('nH', 'µH', 'mH', 'H')),
+    ComponentSpec('R', 'Resistor', ('Ω', 'kΩ', 'MΩ')),
+    ComponentSpec('G', 'Ground', ('-',)),
+)
+
+def walk_blocks(blocks: List[FilterBlock]) -> Iterator[Tuple[FilterBlock, int]]:
+    """Yield (block, nesting level) for blocks and their sub-blocks in pre-order."""
+    stack = deque((block, 0) for block in reversed(blocks))
+    while stack:
+        block, level = stack.pop()
+        yield block, level
+        stack.extend((sub_block, level + 1) for sub_block in reversed(block.sub_blocks))
+
+def format_netlist_line(index: int, comp: Component) -> str:
+    if comp.type == 'G':
+        return f"V{index} {comp.node1} 0 GND"
+    return f"{comp.type}{index} {comp.node1} {comp.node2} {comp.value}{comp.unit}"
 
 class FilterTopology:
     def __init__(self, name: str):
         self.name = name
         self.blocks: List[FilterBlock] = []
+        self.blocks_by_id: Dict[str, FilterBlock] = {}
         self.next_node = 1
+        self._netlist_cache: Optional[str] = None
+        self._dot_cache: Optional[str] = None
+
+    def invalidate(self):
+        """Drop cached output; called by every topology and block mutator."""
+        self._netlist_cache = None
+        self._dot_cache = None
 
     def add_block(self, block: FilterBlock):
-        self.blocks.append(block)
-        self.blocks.sort(key=lambda x: x.position)
+        for sub_block, _ in walk_blocks([block]):
+            sub_block.topology = self
+        insort(self.blocks, block, key=lambda x: x.position)
+        self.blocks_by_id[block.block_id] = block
+        self.invalidate()
 
     def remove_block(self, block_id: str):
         self.blocks = [b for b in self.blocks if b.block_id != block_id]
+        self.blocks_by_id.pop(block_id, None)
         for idx, block in enumerate(self.blocks):
             block.position = idx
+        self.invalidate()
 
     def generate_netlist(self) -> str:
-        """Generate a SPICE-like netlist for the entire topology."""
-        netlist = [f"* Netlist for {self.name}"]
-        component_count = 1
+        """Generate a SPICE-like netlist for the entire topology.
+
+        The result (and the node numbers it assigns) stays cached until a
+        block or component is added or removed, so reruns that leave the
+        topology alone return without walking the tree.
+        """
+        if self._netlist_cache is not None:
+            return self._netlist_cache
+
         self.next_node = 1
-        
-        def process_block(block: FilterBlock, input_node: int) -> int:
-            nonlocal component_count
-            block.start_node = input_node
-            current_node = input_node
-            
-            # Process parallel components
-            parallel_start_node = current_node
+        current_node = 1
+        flat: List[Component] = []
+
+        # Blocks are visited in pre-order: each block starts where the previous
+        # one (including its sub-blocks) ended, and its parallel components
+        # fan out from that node.
+        for block, _ in walk_blocks(self.blocks):
+            block.start_node = current_node
             max_parallel_node = current_node
-            
+
             for comp_type, components in block.components.items():
                 for comp in components:
+                    comp.node1 = current_node
                     if comp_type == 'G':
-                        netlist.append(f"V{component_count} {current_node} 0 GND")
+                        comp.node2 = 0
                     else:
-                        next_node = self.next_node
+                        comp.node2 = self.next_node
                         self.next_node += 1
-                        comp.node1 = parallel_start_node
-                        comp.node2 = next_node
-                        netlist.append(f"{comp.type}{component_count} {parallel_start_node} {next_node} {comp.value}{comp.unit}")
-                        max_parallel_node = max(max_parallel_node, next_node)
-                    component_count += 1
-            
+                        max_parallel_node = max(max_parallel_node, comp.node2)
+                    flat.append(comp)
+
             current_node = max_parallel_node
             block.end_node = current_node
-            
-            # Process sub-blocks
-            for sub_block in block.sub_blocks:
-                current_node = process_block(sub_block, current_node)
-            
-            return current_node
 
-        # Process all top-level blocks
-        current_node = 1
-        for block in self.blocks:
-            current_node = process_block(block, current_node)
+        netlist = [f"* Netlist for {self.name}", *(format_netlist_line(idx, comp) for idx, comp in enumerate(flat, 1))]
+        self._netlist_cache = "\n".join(netlist)
+        return self._netlist_cache
 
-        return "\n".join(netlist)
+def dot_quote(text: str) -> str:
+    """Quote a string as a DOT ID, escaping user-entered names and labels."""
+    escaped = text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return f'"{escaped}"'
 
-def create_circuit_visualization(topology: FilterTopology) -> graphviz.Digraph:
-    graph = graphviz.Digraph()
-    graph.attr(rankdir='LR')
+def create_circuit_visualization(topology: FilterTopology) -> str:
+    """Emit DOT source for the topology directly, without graphviz.Digraph."""
+    lines = ['digraph {', '\trankdir=LR']
     
-    def process_block(block: FilterBlock, parent_node=None):
-        with graph.subgraph(name=f'cluster_{block.block_id}') as s:
-            s.attr(label=block.name)
-            s.attr(style='rounded')
-            
-            in_node = f"{block.block_id}_in"
-            out_node = f"{block.block_id}_out"
-            s.node(in_node, "", shape='point')
-            s.node(out_node, "", shape='point')
-            
-            junction_in = f"{block.block_id}_junction_in"
-            junction_out = f"{block.block_id}_junction_out"
-            s.node(junction_in, "", shape='point')
-            s.node(junction_out, "", shape='point')
-            
-            s.edge(in_node, junction_in)
-            s.edge(junction_out, out_node)
-            
-            has_components = False
-            for comp_type, components in block.components.items():
-                for idx, comp in enumerate(components):
-                    comp_node = f"{block.block_id}_{comp_type}_{idx}"
-                    
-                    if comp_type == 'G':
-                        s.node(comp_node, "⏚", shape='plain')
-                        s.edge(junction_in, comp_node)
-                    else:
-                        label = f"{comp_type}\n{comp.value}{comp.unit}"
-                        s.node(comp_node, label, shape='box', style='filled', fillcolor='lightblue')
-                        s.edge(junction_in, comp_node)
-                        s.edge(comp_node, junction_out)
-                        has_components = True
-            
-            if not has_components:
-                s.edge(junction_in, junction_out)
-            
-            for sub_block in block.sub_blocks:
-                sub_in, sub_out = process_block(sub_block, out_node)
-                graph.edge(out_node, sub_in)
-            
-            return in_node, out_node
+    def add_cluster(block: FilterBlock):
+        block_id = block.block_id
+        in_node = dot_quote(f"{block_id}_in")
+        out_node = dot_quote(f"{block_id}_out")
+        junction_in = dot_quote(f"{block_id}_junction_in")
+        junction_out = dot_quote(f"{block_id}_junction_out")
+        
+        lines.append(f'\tsubgraph {dot_quote(f"cluster_{block_id}")} {{')
+        lines.append(f'\t\tlabel={dot_quote(block.name)}')
+        lines.append('\t\tstyle=rounded')
+        for node in (in_node, out_node, junction_in, junction_out):
+            lines.append(f'\t\t{node} [label="" shape=point]')
+        lines.append(f'\t\t{in_node} -> {junction_in}')
+        lines.append(f'\t\t{junction_out} -> {out_node}')
+        
+        has_components = False
+        for comp_type, components in block.components.items():
+            for idx, comp in enumerate(components):
+                comp_node = dot_quote(f"{block_id}_{comp_type}_{idx}")
+                
+                if comp_type == 'G':
+                    lines.append(f'\t\t{comp_node} [label="⏚" shape=plain]')
+                    lines.append(f'\t\t{junction_in} -> {comp_node}')
+                else:
+                    label = dot_quote(f"{comp_type}\n{comp.value}{comp.unit}")
+                    lines.append(f'\t\t{comp_node} [label={label} fillcolor=lightblue shape=box style=filled]')
+                    lines.append(f'\t\t{junction_in} -> {comp_node}')
+                    lines.append(f'\t\t{comp_node} -> {junction_out}')
+                    has_components = True
+        
+        if not has_components:
+            lines.append(f'\t\t{junction_in} -> {junction_out}')
+        
+        lines.append('\t}')
     
-    graph.node('input', 'IN', shape='diamond')
-    graph.node('output', 'OUT', shape='diamond')
+    lines.append('\tinput [label=IN shape=diamond]')
+    lines.append('\toutput [label=OUT shape=diamond]')
     
+    # Post-order walk with an explicit stack: a block's cluster is emitted
+    # after its sub-blocks, each sub-block is wired from its parent's output,
+    # and top-level blocks are chained from IN to OUT.
     prev_node = 'input'
-    for block in topology.blocks:
-        block_in, block_out = process_block(block)
-        graph.edge(prev_node, block_in)
-        prev_node = block_out
+    stack = deque((block, None, False) for block in reversed(topology.blocks))
+    while stack:
+        block, parent_out, expanded = stack.pop()
+        if not expanded:
+            stack.append((block, parent_out, True))
+            stack.extend((sub_block, dot_quote(f"{block.block_id}_out"), False) for sub_block in reversed(block.sub_blocks))
+            continue
+        
+        add_cluster(block)
+        block_in = dot_quote(f"{block.block_id}_in")
+        if parent_out is None:
+            lines.append(f'\t{prev_node} -> {block_in}')
+            prev_node = dot_quote(f"{block.block_id}_out")
+        else:
+            lines.append(f'\t{parent_out} -> {block_in}')
     
-    graph.edge(prev_node, 'output')
+    lines.append(f'\t{prev_node} -> output')
+    lines.append('}')
     
-    return graph
+    return "\n".join(lines)
 
 def create_default_topologies() -> Dict[str, FilterTopology]:
     return {
@@ -198,8 +250,9 @@ def create_default_topologies() -> Dict[str, FilterTopology]:
 def render_block_components(block: FilterBlock, block_key: str):
     st.write("Components in this block:")
     
-    for component_type, info in COMPONENTS.items():
-        st.subheader(f"{info['name']}s")
+    for spec in COMPONENTS:
+        component_type = spec.type
+        st.subheader(f"{spec.name}s")
         
         for idx, component in enumerate(block.components[component_type]):
             cols = st.columns([3, 2, 1])
@@ -213,24 +266,28 @@ def render_block_components(block: FilterBlock, block_key: str):
                     block.remove_component(component_type, idx)
                     st.rerun()
         
-        cols = st.columns([2, 2, 2, 1])
-        with cols[0]:
-            if component_type != 'G':
-                value = st.number_input(f"New {info['name']} Value", min_value=0.0, format="%f", key=f"value_{block_key}_{component_type}")
-            else:
-                value = 0.0
-        with cols[1]:
-            unit = st.selectbox(f"Unit", info['units'], key=f"unit_{block_key}_{component_type}")
-        with cols[2]:
-            if st.button(f"Add {component_type}", key=f"add_{block_key}_{component_type}"):
-                block.add_component(component_type, value, unit)
-                st.rerun()
+        # Inside a form, editing the value or unit does not rerun the script;
+        # only the Add button does.
+        with st.form(key=f"form_{block_key}_{component_type}", border=False):
+            cols = st.columns([2, 2, 2, 1])
+            with cols[0]:
+                if component_type != 'G':
+                    value = st.number_input(f"New {spec.name} Value", min_value=0.0, format="%f", key=f"value_{block_key}_{component_type}")
+                else:
+                    value = 0.0
+            with cols[1]:
+                unit = st.selectbox(f"Unit", spec.units, key=f"unit_{block_key}_{component_type}")
+            with cols[2]:
+                if st.form_submit_button(f"Add {component_type}", key=f"add_{block_key}_{component_type}"):
+                    block.add_component(component_type, value, unit)
+                    st.rerun()
 
 def render_circuit_view(topology):
     st.header('Circuit Visualization')
     if topology.blocks:
-        circuit_graph = create_circuit_visualization(topology)
-        st.graphviz_chart(circuit_graph)
+        if topology._dot_cache is None:
+            topology._dot_cache = create_circuit_visualization(topology)
+        st.graphviz_chart(topology._dot_cache)
     else:
         st.write("Add blocks to see the circuit visualization")
 
@@ -254,59 +311,57 @@ def main():
     if selected_topology != st.session_state.current_topology:
         st.session_state.current_topology = selected_topology
         st.session_state.block_counter = len(st.session_state.topologies[selected_topology].blocks)
+        st.session_state.pop('flat_blocks_cache', None)
 
     topology = st.session_state.topologies[selected_topology]
     
+    # Only block add/remove and topology switches change this list, and
+    # each of those drops the cached copy.
+    if 'flat_blocks_cache' not in st.session_state:
+        st.session_state.flat_blocks_cache = list(walk_blocks(topology.blocks))
+    all_blocks = st.session_state.flat_blocks_cache
+    
     st.header('Manage Blocks')
     
     col1, col2 = st.columns(2)
     
     with col1:
         st.subheader("Add New Block")
-        new_block_name = st.text_input("Block Name", value=f"Block {st.session_state.block_counter + 1}")
-        parent_options = ["None"] + [f"{block.name} ({block.block_id})" for block in topology.blocks]
-        parent_block = st.selectbox("Parent Block", parent_options)
-        
-        if st.button("Add Block"):
-            new_block = FilterBlock(new_block_name, st.session_state.block_counter)
-            if parent_block == "None":
-                topology.add_block(new_block)
-            else:
-                parent_id = parent_block.split("(")[1].rstrip(")")
-                for block in topology.blocks:
-                    if block.block_id == parent_id:
-                        block.add_sub_block(new_block)
-                        break
-            st.session_state.block_counter += 1
-            st.rerun()
+        with st.form(key="add_block_form", border=False):
+            new_block_name = st.text_input("Block Name", value=f"Block {st.session_state.block_counter + 1}")
+            parent_options = {"None": "None", **{block.block_id: block.name for block in topology.blocks}}
+            parent_id = st.selectbox("Parent Block", list(parent_options), format_func=parent_options.get)
+            
+            if st.form_submit_button("Add Block"):
+                new_block = FilterBlock(new_block_name, st.session_state.block_counter)
+                if parent_id == "None":
+                    topology.add_block(new_block)
+                else:
+                    topology.blocks_by_id[parent_id].add_sub_block(new_block)
+                st.session_state.block_counter += 1
+                st.session_state.pop('flat_blocks_cache', None)
+                st.rerun()
     
     with col2:
         st.subheader("Remove Block")
         if topology.blocks:
-            blocks_to_remove = []
-            for block in topology.blocks:
-                blocks_to_remove.append(f"{block.name} ({block.block_id})")
-                for sub_block in block.sub_blocks:
-                    blocks_to_remove.append(f"  ↳ {sub_block.name} ({sub_block.block_id})")
+            remove_options = {
+                block.block_id: f"{'  ' * level}↳ {block.name}" if level else block.name
+                for block, level in all_blocks
+            }
             
-            block_to_remove = st.selectbox("Select Block", blocks_to_remove)
+            block_id = st.selectbox("Select Block", list(remove_options), format_func=remove_options.get)
             if st.button("Remove Selected Block"):
-                block_id = block_to_remove.split("(")[1].rstrip(")")
                 topology.remove_block(block_id)
-                for block in topology.blocks:
+                for block, _ in walk_blocks(topology.blocks):
                     block.remove_sub_block(block_id)
                 st.session_state.block_counter -= 1
+                st.session_state.pop('flat_blocks_cache', None)
                 st.rerun()
 
     if topology.blocks:
         st.header(f'Configure {selected_topology}')
         
-        all_blocks = []
-        for block in topology.blocks:
-            all_blocks.append((block, 0))
-            for sub_block in block.sub_blocks:
-                all_blocks.append((sub_block, 1))
-        
         tabs = st.tabs([f"{'  ' * level}{block.name}" for block, level in all_blocks])
         
         for tab, (block, _) in zip(tabs, all_blocks):